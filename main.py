@@ -1,79 +1,477 @@
-import asyncio, requests
+import asyncio
 from bilibili_api import live, Credential, Danmaku
 from pathlib import Path
 import yaml
 import os
 import sys
 import logging
+import logging.handlers
 from datetime import datetime, timedelta
 import time
-import re
+try:
+    import re2 as re  # 线性时间匹配，防止恶意正则导致回溯卡死
+except ImportError:
+    import re
 import json
+try:
+    import orjson  # C 实现的 JSON，历史记录增长后解析/序列化明显更快
+    _json_loads = orjson.loads
+
+    def _json_dump_line(obj):
+        return orjson.dumps(obj) + b"\n"
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dump_line(obj):
+        return (json.dumps(obj, ensure_ascii=False) + "\n").encode('utf-8')
 import pickle
+import heapq
+import random
 from collections import defaultdict, deque
-from flask import Flask, request, render_template_string
+from flask import Flask, request, render_template_string, Response, jsonify
+from jinja2 import Environment
 import threading
-from queue import Queue
+from queue import SimpleQueue
+
+def load_history_file(path="ban_history.jsonl", legacy_path="ban_history.json"):
+    """读取追加式 JSONL 封禁历史；兼容旧版整文件 JSON，并合并解禁补丁行。"""
+    if not os.path.exists(path):
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return []
+    history = []
+    open_records = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = _json_loads(line)
+            if entry.get("op") == "unban":
+                record = open_records.pop(entry["user_uid"], None)
+                if record is not None:
+                    record["actual_unban_time"] = entry["actual_unban_time"]
+                    record["status"] = "已解禁"
+            else:
+                history.append(entry)
+                if "actual_unban_time" not in entry:
+                    open_records[entry["user_uid"]] = entry
+    return history
+
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+def _cached_load(path, loader):
+    """按 (mtime_ns, size) 缓存文件解析结果，文件未变时只付一次 stat 的成本。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    obj = loader(path)
+    with _file_cache_lock:
+        _file_cache[path] = (key, obj)
+    return obj
+
+def _load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def _load_banned_json(path):
+    with open(path, 'rb') as f:
+        raw = _json_loads(f.read())
+    return {int(uid): (name, ban_ts) for uid, (name, ban_ts) in raw.items()}
+
+def _load_history_cached():
+    history = _cached_load("ban_history.jsonl", load_history_file)
+    if history is None:
+        history = load_history_file()  # 走旧版整文件 JSON 的兼容路径
+    return history
+
+# 模板只在导入时编译一次，autoescape 顺带堵上用户名带 HTML 的注入口
+_template_env = Environment(autoescape=True)
+
+BANNED_TEMPLATE = _template_env.from_string("""
+{% if rows %}
+<div class="stats">
+    <div class="stat-card">
+        <div class="stat-number">{{ rows|length }}</div>
+        <div class="stat-label">当前禁言人数</div>
+    </div>
+</div>
+<table>
+    <thead>
+        <tr>
+            <th>用户ID</th>
+            <th>用户名</th>
+            <th>禁言时间</th>
+            <th>剩余时间</th>
+        </tr>
+    </thead>
+    <tbody>
+    {% for row in rows %}
+        <tr>
+            <td>{{ row.uid }}</td>
+            <td>{{ row.name }}</td>
+            <td>{{ row.ban_time }}</td>
+            <td>{{ row.remaining }}</td>
+        </tr>
+    {% endfor %}
+    </tbody>
+</table>
+{% else %}
+<div class="empty-state">
+    <div class="icon">✅</div>
+    <h3>暂无禁言用户</h3>
+    <p>当前没有用户被禁言</p>
+</div>
+{% endif %}
+""")
+
+HISTORY_TEMPLATE = _template_env.from_string("""
+{% if rows %}
+<div class="stats">
+    <div class="stat-card">
+        <div class="stat-number">{{ total_records }}</div>
+        <div class="stat-label">总封禁记录</div>
+    </div>
+    <div class="stat-card">
+        <div class="stat-number">{{ active_bans }}</div>
+        <div class="stat-label">当前禁言中</div>
+    </div>
+</div>
+<table>
+    <thead>
+        <tr>
+            <th>用户ID</th>
+            <th>用户名</th>
+            <th>禁言时间</th>
+            <th>解禁时间</th>
+            <th>禁言时长</th>
+            <th>状态</th>
+            <th>原因</th>
+        </tr>
+    </thead>
+    <tbody>
+    {% for row in rows %}
+        <tr>
+            <td>{{ row.user_uid }}</td>
+            <td>{{ row.user_name }}</td>
+            <td>{{ row.ban_time }}</td>
+            <td>{{ row.unban_time }}</td>
+            <td>{{ row.ban_hours }}小时</td>
+            <td><span class="{{ row.status_class }}">{{ row.status }}</span></td>
+            <td>{{ row.reason }}</td>
+        </tr>
+    {% endfor %}
+    </tbody>
+</table>
+{% else %}
+<div class="empty-state">
+    <div class="icon">📝</div>
+    <h3>暂无封禁记录</h3>
+    <p>还没有封禁记录</p>
+</div>
+{% endif %}
+""")
+
+RANKING_TEMPLATE = _template_env.from_string("""
+{% if rows %}
+<div class="stats">
+    <div class="stat-card">
+        <div class="stat-number">{{ total_users }}</div>
+        <div class="stat-label">被封禁用户数</div>
+    </div>
+    <div class="stat-card">
+        <div class="stat-number">{{ total_bans }}</div>
+        <div class="stat-label">总封禁次数</div>
+    </div>
+</div>
+<table class="ranking-table">
+    <thead>
+        <tr>
+            <th>排名</th>
+            <th>用户ID</th>
+            <th>用户名</th>
+            <th>封禁次数</th>
+            <th>总禁言时长(小时)</th>
+            <th>最后封禁时间</th>
+        </tr>
+    </thead>
+    <tbody>
+    {% for row in rows %}
+        <tr class="{{ 'rank-' ~ loop.index if loop.index <= 3 else '' }}">
+            <td><strong>{{ loop.index }}</strong></td>
+            <td>{{ row.user_uid }}</td>
+            <td>{{ row.user_name }}</td>
+            <td>{{ row.ban_count }}</td>
+            <td>{{ row.total_hours }}</td>
+            <td>{{ row.last_ban_time }}</td>
+        </tr>
+    {% endfor %}
+    </tbody>
+</table>
+{% else %}
+<div class="empty-state">
+    <div class="icon">🏆</div>
+    <h3>暂无排行榜数据</h3>
+    <p>还没有封禁记录</p>
+</div>
+{% endif %}
+""")
+
+def render_history_html(history_data):
+    rows = []
+    for record in history_data[-100:][::-1]:  # 显示最近100条
+        actual_unban_time = record.get("actual_unban_time", "")
+        rows.append({
+            "user_uid": record.get("user_uid", ""),
+            "user_name": record.get("user_name", ""),
+            "ban_time": record.get("ban_time", "")[:19],
+            "unban_time": (actual_unban_time or record.get("unban_time", ""))[:19],
+            "ban_hours": record.get("ban_hours", 2),
+            "status": "已解禁" if actual_unban_time else "禁言中",
+            "status_class": "status-unbanned" if actual_unban_time else "status-banned",
+            "reason": record.get("reason", "关键词刷屏")
+        })
+    return HISTORY_TEMPLATE.render(
+        rows=rows,
+        total_records=len(history_data),
+        active_bans=sum(1 for r in history_data if not r.get("actual_unban_time"))
+    )
+
+def render_ranking_html(history_data):
+    ban_count = defaultdict(int)
+    total_ban_hours = defaultdict(int)
+    last_ban_time = {}
+    user_names = {}
+
+    for record in history_data:
+        user_uid = record["user_uid"]
+        ban_hours = record["ban_hours"]
+
+        ban_count[user_uid] += 1
+        total_ban_hours[user_uid] += ban_hours
+        last_ban_time[user_uid] = record["ban_time"]
+        user_names[user_uid] = record["user_name"]
+
+    ranking = []
+    for user_uid, count in ban_count.items():
+        ranking.append({
+            "user_uid": user_uid,
+            "user_name": user_names[user_uid],
+            "ban_count": count,
+            "total_hours": total_ban_hours[user_uid],
+            "last_ban_time": last_ban_time[user_uid][:19]
+        })
+
+    ranking.sort(key=lambda x: x["ban_count"], reverse=True)
+
+    return RANKING_TEMPLATE.render(
+        rows=ranking[:20],
+        total_users=len(ranking),
+        total_bans=sum(user["ban_count"] for user in ranking)
+    )
+
+def _setup_chat_logger():
+    """弹幕日志走后台线程输出，避免在事件循环里做同步 I/O。"""
+    log_q = SimpleQueue()
+    listener = logging.handlers.QueueListener(log_q, logging.StreamHandler())
+    listener.start()
+    chat = logging.getLogger("chat")
+    chat.setLevel(logging.INFO)
+    chat.addHandler(logging.handlers.QueueHandler(log_q))
+    chat.propagate = False
+    return chat
+
+chat_logger = _setup_chat_logger()
+app_logger = logging.getLogger("B站直播监控")
+
+def _patch_bilibili_json():
+    """把 bilibili_api 里模块级引用的 json 换成 orjson，加速弹幕帧解析。"""
+    try:
+        import orjson
+        from bilibili_api import live as _bili_live
+        from bilibili_api.utils import network as _bili_network
+    except ImportError:
+        return  # 未安装 orjson 或库结构有变时保持原样
+
+    class _OrjsonShim:
+        loads = staticmethod(orjson.loads)
+
+        @staticmethod
+        def dumps(obj, *args, **kwargs):
+            if args or kwargs:
+                # orjson 不认标准库的格式化参数，带参调用原样走标准库
+                return json.dumps(obj, *args, **kwargs)
+            return orjson.dumps(obj).decode('utf-8')
+
+        def __getattr__(self, name):
+            # 其余属性（JSONDecodeError 等）转发给标准库 json
+            return getattr(json, name)
+
+    shim = _OrjsonShim()
+    for _mod in (_bili_live, _bili_network):
+        if getattr(_mod, "json", None) is json:
+            _mod.json = shim
+
+_patch_bilibili_json()
+
+_hms_cache = [0, '']
+
+def _now_hms():
+    """同一秒内的弹幕复用已格式化的时间串，不必每条都跑 strftime。"""
+    now = int(time.time())
+    cache = _hms_cache
+    if cache[0] != now:
+        cache[0] = now
+        cache[1] = time.strftime('%H:%M:%S', time.localtime(now))
+    return cache[1]
 
 restart_requested = False
-danmaku_room = None
-danmaku_messages = Queue(maxsize=1000)
+main_loop = None
+http_session = None
+danmaku_messages = asyncio.Queue(maxsize=1000)
+recent_danmaku = deque(maxlen=1000)
 
 class PersistentUnbanManager:
-    def __init__(self, room, config, data_file="banned_users.pkl", ban_history_file="ban_history.json"):
+    def __init__(self, room, config, data_file="banned_users.json", ban_history_file="ban_history.jsonl"):
         self.room = room
         self.config = config
         self.data_file = data_file
+        self.legacy_data_file = "banned_users.pkl"
         self.ban_history_file = ban_history_file
+        self.history_archive_file = "ban_history_archive.jsonl"
+        self.max_history_records = 10000
         self.banned_users = self.load_banned_users()
         self.ban_history = self.load_ban_history()
+        # 禁言时长在运行期不变，启动时解析一次，热路径不再查配置字典
+        self.ban_hours = config.get("禁言时长", 2)
+        self._ban_seconds = self.ban_hours * 3600
+        self._unban_heap = [
+            (ban_ts + self._ban_seconds, uid)
+            for uid, (name, ban_ts) in self.banned_users.items()
+        ]
+        heapq.heapify(self._unban_heap)
+        self._open_records = {
+            record["user_uid"]: record
+            for record in self.ban_history
+            if "actual_unban_time" not in record
+        }
+        self._version = 0
+        self._ranking_counts = self._build_ranking_counts(self.ban_history)
+        self._ranking_cache = (None, None, None)
+        self._hash_cache = (None, None)
+        self._dirty = False
+        self._flush_task = None
+        self._save_lock = asyncio.Lock()
+        # Flask 线程直接读内存态，读写都要过这把锁
+        self.state_lock = threading.RLock()
+        self._write_q = SimpleQueue()
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
 
     def load_banned_users(self):
         try:
             if os.path.exists(self.data_file):
-                with open(self.data_file, 'rb') as f:
+                return _load_banned_json(self.data_file)
+            if os.path.exists(self.legacy_data_file):
+                # 旧版 pickle 存档，读入后下次落盘即转为 JSON
+                with open(self.legacy_data_file, 'rb') as f:
                     data = pickle.load(f)
-                    for uid, (name, ban_time_str) in data.items():
-                        data[uid] = (name, datetime.fromisoformat(ban_time_str))
-                    return data
+                for uid, (name, ban_time) in data.items():
+                    if isinstance(ban_time, str):
+                        # 更旧的版本以 ISO 字符串存储，迁移为 POSIX 时间戳
+                        data[uid] = (name, datetime.fromisoformat(ban_time).timestamp())
+                return data
         except Exception as e:
-            print(f"[错误] 加载禁言列表失败: {e}")
+            app_logger.error("[错误] 加载禁言列表失败: %s", e)
         return {}
 
     def load_ban_history(self):
         try:
-            if os.path.exists(self.ban_history_file):
-                with open(self.ban_history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            history = load_history_file(self.ban_history_file)
+            if history and not os.path.exists(self.ban_history_file):
+                # 从旧版整文件 JSON 迁移为追加式 JSONL
+                self._rewrite_history(history)
+            return history
         except Exception as e:
-            print(f"[错误] 加载封禁历史失败: {e}")
+            app_logger.error("[错误] 加载封禁历史失败: %s", e)
         return []
 
     def save_banned_users(self):
         try:
-            save_data = {}
-            for uid, (name, ban_time) in self.banned_users.items():
-                save_data[uid] = (name, ban_time.isoformat())
-
-            with open(self.data_file, 'wb') as f:
-                pickle.dump(save_data, f)
+            with self.state_lock:
+                snapshot = {
+                    str(uid): [name, ban_ts]
+                    for uid, (name, ban_ts) in self.banned_users.items()
+                }
+            tmp_file = self.data_file + ".tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(_json_dump_line(snapshot))
+            os.replace(tmp_file, self.data_file)  # 原子替换，崩溃也不会留下半个文件
         except Exception as e:
-            print(f"[错误] 保存禁言列表失败: {e}")
+            app_logger.error("[错误] 保存禁言列表失败: %s", e)
 
-    def save_ban_history(self):
-        try:
-            with open(self.ban_history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.ban_history, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"[错误] 保存封禁历史失败: {e}")
+    def _rewrite_history(self, history):
+        with open(self.ban_history_file, 'w', encoding='utf-8') as f:
+            for record in history:
+                f.write(_json_dump_line(record).decode('utf-8'))
+
+    def _writer_loop(self):
+        while True:
+            item = self._write_q.get()
+            if item is None:
+                break
+            file_name, payload, mode = item
+            try:
+                with open(file_name, mode) as f:
+                    f.write(payload)
+            except Exception as e:
+                app_logger.error("[错误] 写入 %s 失败: %s", file_name, e)
+
+    def _append_history(self, entry):
+        payload = _json_dump_line(entry)
+        self._write_q.put_nowait((self.ban_history_file, payload, 'ab'))
+
+    def close(self):
+        # 结束后台写线程；队列里已排队的写入会先落盘再退出
+        self._write_q.put_nowait(None)
+
+    def _rotate_history(self):
+        # 旧的一半滚动到归档文件，内存和页面扫描规模保持有界
+        half = len(self.ban_history) // 2
+        archived = self.ban_history[:half]
+        del self.ban_history[:half]
+        archive_payload = b"".join(_json_dump_line(r) for r in archived)
+        self._write_q.put_nowait((self.history_archive_file, archive_payload, 'ab'))
+        # 活动文件重写为剩余记录；走同一个写队列，与追加写保持先后顺序
+        live_payload = b"".join(_json_dump_line(r) for r in self.ban_history)
+        self._write_q.put_nowait((self.ban_history_file, live_payload, 'wb'))
+        # 截断后聚合重建一次，保持与保留的历史一致
+        self._ranking_counts = self._build_ranking_counts(self.ban_history)
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._debounced_flush())
+
+    async def _debounced_flush(self):
+        await asyncio.sleep(1.0)
+        if self._dirty:
+            self._dirty = False
+            async with self._save_lock:
+                await asyncio.to_thread(self.save_banned_users)
 
     async def ban_user_with_auto_unban(self, user_uid, user_name):
-        ban_hours = self.config.get("禁言时长", 2)
+        ban_hours = self.ban_hours
         result = await self.room.ban_user(uid=user_uid, hour=ban_hours)
         ban_time = datetime.now()
-        self.banned_users[user_uid] = (user_name, ban_time)
-        self.save_banned_users()
-
         ban_record = {
             "user_uid": user_uid,
             "user_name": user_name,
@@ -82,110 +480,147 @@ class PersistentUnbanManager:
             "unban_time": (ban_time + timedelta(hours=ban_hours)).isoformat(),
             "reason": "关键词刷屏"
         }
-        self.ban_history.append(ban_record)
-        self.save_ban_history()
-
-        print(f"[禁言] 已禁言用户: {user_name}，将在{ban_hours}小时后自动解禁")
+        with self.state_lock:
+            self.banned_users[user_uid] = (user_name, ban_time.timestamp())
+            heapq.heappush(self._unban_heap, (ban_time.timestamp() + ban_hours * 3600, user_uid))
+            self.ban_history.append(ban_record)
+            self._open_records[user_uid] = ban_record
+            # 排行聚合随每条记录增量维护，排行页不再全量扫历史
+            s = self._ranking_counts.get(user_uid)
+            if s is None:
+                self._ranking_counts[user_uid] = [1, ban_hours, user_name, ban_record["ban_time"]]
+            else:
+                s[0] += 1
+                s[1] += ban_hours
+                s[2] = user_name
+                s[3] = ban_record["ban_time"]
+            self._version += 1
+        self._append_history(ban_record)
+        with self.state_lock:
+            if len(self.ban_history) > self.max_history_records:
+                self._rotate_history()
+        self._mark_dirty()
+
+        app_logger.info("[禁言] 已禁言用户: %s，将在%s小时后自动解禁", user_name, ban_hours)
         return result
 
     async def check_and_unban(self):
         current_time = datetime.now()
+        now_ts = current_time.timestamp()
         users_to_unban = []
-        ban_hours = self.config.get("禁言时长", 2)
-
-        for user_uid, (user_name, ban_time) in list(self.banned_users.items()):
-            if current_time - ban_time >= timedelta(hours=ban_hours):
-                users_to_unban.append((user_uid, user_name))
-
-        for user_uid, user_name in users_to_unban:
-            try:
-                await self.room.unban_user(uid=user_uid)
-                print(f"[解禁] 已自动解禁用户: {user_name} (UID: {user_uid})")
-                del self.banned_users[user_uid]
-
-                for record in self.ban_history:
-                    if record["user_uid"] == user_uid and "actual_unban_time" not in record:
-                        record["actual_unban_time"] = current_time.isoformat()
-                        record["status"] = "已解禁"
-                        break
-                self.save_ban_history()
-
-            except Exception as e:
-                print(f"[解禁错误] 解禁用户 {user_name} 失败: {e}")
+        ban_seconds = self._ban_seconds
+
+        with self.state_lock:
+            while self._unban_heap and self._unban_heap[0][0] <= now_ts:
+                _, user_uid = heapq.heappop(self._unban_heap)
+                entry = self.banned_users.get(user_uid)
+                if entry is None:
+                    continue
+                user_name, ban_ts = entry
+                if now_ts - ban_ts >= ban_seconds:
+                    users_to_unban.append((user_uid, user_name))
+                else:
+                    # 被重新禁言过，按新的到期时间重新入堆
+                    heapq.heappush(self._unban_heap, (ban_ts + ban_seconds, user_uid))
+
+        if not users_to_unban:
+            return
+
+        # 到期的解禁请求相互独立，限流并发发出，把 N 次串行往返压成少数几批
+        semaphore = asyncio.Semaphore(8)
+
+        async def unban_one(uid):
+            async with semaphore:
+                await self.room.unban_user(uid=uid)
+
+        results = await asyncio.gather(
+            *(unban_one(user_uid) for user_uid, _ in users_to_unban),
+            return_exceptions=True
+        )
+
+        for (user_uid, user_name), result in zip(users_to_unban, results):
+            if isinstance(result, Exception):
+                app_logger.error("[解禁错误] 解禁用户 %s 失败: %s", user_name, result)
+                # 失败的解禁重新入堆稍后重试，否则用户会永远留在禁言表里
+                with self.state_lock:
+                    heapq.heappush(self._unban_heap, (now_ts + 60.0, user_uid))
+                continue
+            app_logger.info("[解禁] 已自动解禁用户: %s (UID: %s)", user_name, user_uid)
+            with self.state_lock:
+                self.banned_users.pop(user_uid, None)
+                record = self._open_records.pop(user_uid, None)
+            if record is not None:
+                record["actual_unban_time"] = current_time.isoformat()
+                record["status"] = "已解禁"
+                self._append_history({
+                    "op": "unban",
+                    "user_uid": user_uid,
+                    "actual_unban_time": record["actual_unban_time"]
+                })
 
-        if users_to_unban:
-            self.save_banned_users()
+        self._version += 1
+        self._mark_dirty()
 
     async def sync_banned_status(self):
-        current_time = datetime.now()
-        users_to_remove = []
-        ban_hours = self.config.get("禁言时长", 2)
+        # 启动清理与周期检查共用同一套到期堆逻辑，堆在 __init__ 已按存档重建
+        await self.check_and_unban()
 
-        for user_uid, (user_name, ban_time) in list(self.banned_users.items()):
-            if current_time - ban_time >= timedelta(hours=ban_hours):
-                users_to_remove.append((user_uid, user_name))
-
-        for user_uid, user_name in users_to_remove:
-            try:
-                await self.room.unban_user(uid=user_uid)
-                print(f"[解禁] 用户 {user_name} 禁言时间已到，已解禁")
-                del self.banned_users[user_uid]
-
-                for record in self.ban_history:
-                    if record["user_uid"] == user_uid and "actual_unban_time" not in record:
-                        record["actual_unban_time"] = current_time.isoformat()
-                        record["status"] = "已解禁"
-                        break
-                self.save_ban_history()
-
-            except Exception as e:
-                print(f"[解禁错误] 用户 {user_name} 解禁失败: {e}")
-
-        if users_to_remove:
-            self.save_banned_users()
+    @staticmethod
+    def _build_ranking_counts(history):
+        counts = {}
+        for record in history:
+            user_uid = record["user_uid"]
+            s = counts.get(user_uid)
+            if s is None:
+                counts[user_uid] = [1, record["ban_hours"], record["user_name"], record["ban_time"]]
+            else:
+                s[0] += 1
+                s[1] += record["ban_hours"]
+                s[2] = record["user_name"]
+                s[3] = record["ban_time"]
+        return counts
+
+    def next_unban_deadline(self):
+        with self.state_lock:
+            if self._unban_heap:
+                return self._unban_heap[0][0]
+        return None
 
     def get_ban_history(self, limit=100):
         return self.ban_history[-limit:][::-1]
 
-    def get_ban_ranking(self, limit=20):
-        ban_count = defaultdict(int)
-        total_ban_hours = defaultdict(int)
-        last_ban_time = {}
-
-        for record in self.ban_history:
-            user_uid = record["user_uid"]
-            user_name = record["user_name"]
-            ban_hours = record["ban_hours"]
-
-            ban_count[user_uid] += 1
-            total_ban_hours[user_uid] += ban_hours
-            last_ban_time[user_uid] = record["ban_time"]
+    def get_data_hash(self):
+        version, cached = self._hash_cache
+        if version == self._version:
+            return cached
+        data_hash = f"{len(self.banned_users)}:{len(self.ban_history)}:{self._version}"
+        self._hash_cache = (self._version, data_hash)
+        return data_hash
 
-        ranking = []
-        for user_uid, count in ban_count.items():
-            ranking.append({
+    def get_ban_ranking(self, limit=20):
+        """返回 (前 limit 名, 被封用户总数, 总封禁次数)，按版本号缓存。"""
+        version, cached_limit, cached = self._ranking_cache
+        if version == self._version and cached_limit == limit:
+            return cached
+        with self.state_lock:
+            stats = {uid: list(s) for uid, s in self._ranking_counts.items()}
+
+        ranking = [
+            {
                 "user_uid": user_uid,
-                "user_name": next((r["user_name"] for r in self.ban_history if r["user_uid"] == user_uid), "未知用户"),
-                "ban_count": count,
-                "total_hours": total_ban_hours[user_uid],
-                "last_ban_time": last_ban_time[user_uid]
-            })
-
-        ranking.sort(key=lambda x: x["ban_count"], reverse=True)
-        return ranking[:limit]
-
-class SimpleWebConfig:
-    def __init__(self, config_path, port=5000):
-        self.config_path = Path(config_path)
-        self.port = port
-        self.app = Flask(__name__)
-        self.setup_routes()
+                "user_name": s[2],
+                "ban_count": s[0],
+                "total_hours": s[1],
+                "last_ban_time": s[3][:19]
+            }
+            for user_uid, s in stats.items()
+        ]
+        rows = heapq.nlargest(limit, ranking, key=lambda x: x["ban_count"])
+        result = (rows, len(ranking), sum(s[0] for s in stats.values()))
+        self._ranking_cache = (self._version, limit, result)
+        return result
 
-    def setup_routes(self):
-        # 提供主页面
-        @self.app.route('/')
-        def index():
-            return """
+INDEX_HTML = ("""
 <!DOCTYPE html>
 <html>
 <head>
@@ -412,6 +847,7 @@ class SimpleWebConfig:
 
         function showPage(page) {
             currentPage = page;
+            lastDataHash = '';
             document.querySelectorAll('.nav-btn').forEach(btn => {
                 btn.classList.remove('active');
             });
@@ -423,29 +859,19 @@ class SimpleWebConfig:
             fetch('/api/' + page)
                 .then(response => response.json())
                 .then(data => {
-                    document.getElementById('contentArea').innerHTML = data.html;
+                    if (data.data_hash !== lastDataHash) {
+                        document.getElementById('contentArea').innerHTML = data.html;
+                        lastDataHash = data.data_hash;
+                    }
                     document.getElementById('updateTime').textContent = data.timestamp;
-                    lastDataHash = data.data_hash;
                 })
                 .catch(error => {
                     document.getElementById('contentArea').innerHTML = '<div class="empty-state"><div class="icon">❌</div><h3>加载失败</h3><p>' + error + '</p></div>';
                 });
         }
 
-        function checkForUpdates() {
-            if (!currentPage) return;
-
-            fetch('/api/check_update?page=' + currentPage + '&hash=' + lastDataHash)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.updated) {
-                        loadPageData(currentPage);
-                    }
-                    document.getElementById('updateTime').textContent = data.timestamp;
-                });
-        }
-
-        setInterval(checkForUpdates, 2000);
+        // 带 If-None-Match 重新拉取，数据没变时只有一次 304 头部往返
+        setInterval(() => loadPageData(currentPage), 2000);
 
         window.onload = function() {
             showPage('banned');
@@ -453,84 +879,101 @@ class SimpleWebConfig:
     </script>
 </body>
 </html>
-            """
+            """).encode('utf-8')
+
+class SimpleWebConfig:
+    def __init__(self, config_path, port=5000, manager=None):
+        self.config_path = Path(config_path)
+        self.port = port
+        self.manager = manager
+        self._page_cache = {}
+        self.app = Flask(__name__)
+        try:
+            from flask_compress import Compress
+        except ImportError:
+            pass
+        else:
+            self.app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+            self.app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+            Compress(self.app)
+        self.setup_routes()
+
+    def _snapshot_banned(self):
+        manager = self.manager
+        if manager is None:
+            # 机器人尚未连上直播间时退回读文件
+            data = _cached_load("banned_users.json", _load_banned_json)
+            if data is None:
+                data = _cached_load("banned_users.pkl", _load_pickle)
+            return data or {}
+        with manager.state_lock:
+            return dict(manager.banned_users)
+
+    def _data_hash(self, fallback_data):
+        manager = self.manager
+        if manager is not None:
+            # 版本号指纹 O(1)，不用把整个数据结构 repr 出来再哈希
+            return manager.get_data_hash()
+        return str(hash(str(fallback_data)))
+
+    def _snapshot_history(self):
+        manager = self.manager
+        if manager is None:
+            return _load_history_cached()
+        with manager.state_lock:
+            return list(manager.ban_history)
+
+    def setup_routes(self):
+        # 提供主页面
+        @self.app.route('/')
+        def index():
+            resp = Response(INDEX_HTML, mimetype='text/html; charset=utf-8')
+            # 页面本身不随数据变化，让浏览器缓存，轮询只打 /api/*
+            resp.headers['Cache-Control'] = 'public, max-age=3600'
+            resp.set_etag(str(hash(INDEX_HTML)))
+            return resp.make_conditional(request)
 
         # API 路由 - 当前禁言用户
         @self.app.route('/api/banned')
         def api_banned():
             try:
-                banned_data = {}
-                if os.path.exists("banned_users.pkl"):
-                    with open("banned_users.pkl", 'rb') as f:
-                        banned_data = pickle.load(f)
+                banned_data = self._snapshot_banned()
 
                 current_time = datetime.now()
-                html = ""
-
-                if banned_data:
-                    # 统计信息
-                    total_banned = len(banned_data)
-                    html += f"""
-                    <div class="stats">
-                        <div class="stat-card">
-                            <div class="stat-number">{total_banned}</div>
-                            <div class="stat-label">当前禁言人数</div>
-                        </div>
-                    </div>
-                    """
-
-                    html += """
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>用户ID</th>
-                                <th>用户名</th>
-                                <th>禁言时间</th>
-                                <th>剩余时间</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                    """
-
-                    for uid, (name, ban_time_str) in banned_data.items():
-                        ban_time = datetime.fromisoformat(ban_time_str)
-                        ban_hours = 2
-                        remaining = timedelta(hours=ban_hours) - (current_time - ban_time)
-
-                        if remaining.total_seconds() > 0:
-                            hours = int(remaining.total_seconds() // 3600)
-                            minutes = int((remaining.total_seconds() % 3600) // 60)
-                            remaining_str = f"{hours}小时{minutes}分钟"
-                        else:
-                            remaining_str = "已解禁"
-
-                        html += f"""
-                            <tr>
-                                <td>{uid}</td>
-                                <td>{name}</td>
-                                <td>{ban_time.strftime('%Y-%m-%d %H:%M:%S')}</td>
-                                <td>{remaining_str}</td>
-                            </tr>
-                        """
-
-                    html += """
-                        </tbody>
-                    </table>
-                    """
-                else:
-                    html = """
-                    <div class="empty-state">
-                        <div class="icon">✅</div>
-                        <h3>暂无禁言用户</h3>
-                        <p>当前没有用户被禁言</p>
-                    </div>
-                    """
-
-                return {
+                ban_delta = timedelta(hours=2)
+                rows = []
+                for uid, (name, ban_ts) in banned_data.items():
+                    if isinstance(ban_ts, str):
+                        ban_time = datetime.fromisoformat(ban_ts)
+                    else:
+                        ban_time = datetime.fromtimestamp(ban_ts)
+                    remaining = ban_delta - (current_time - ban_time)
+
+                    if remaining.total_seconds() > 0:
+                        hours = int(remaining.total_seconds() // 3600)
+                        minutes = int((remaining.total_seconds() % 3600) // 60)
+                        remaining_str = f"{hours}小时{minutes}分钟"
+                    else:
+                        remaining_str = "已解禁"
+
+                    rows.append({
+                        "uid": uid,
+                        "name": name,
+                        "ban_time": ban_time.strftime('%Y-%m-%d %H:%M:%S'),
+                        "remaining": remaining_str
+                    })
+
+                html = BANNED_TEMPLATE.render(rows=rows)
+
+                data_hash = self._data_hash(banned_data)
+                resp = jsonify({
                     "html": html,
                     "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    "data_hash": str(hash(str(banned_data)))
-                }
+                    "data_hash": data_hash
+                })
+                resp.set_etag(data_hash)
+                resp.headers['Cache-Control'] = 'no-cache, must-revalidate'
+                return resp.make_conditional(request)
 
             except Exception as e:
                 return {
@@ -543,92 +986,22 @@ class SimpleWebConfig:
         @self.app.route('/api/history')
         def api_history():
             try:
-                history_data = []
-                if os.path.exists("ban_history.json"):
-                    with open("ban_history.json", 'r', encoding='utf-8') as f:
-                        history_data = json.load(f)
-
-                html = ""
-
-                if history_data:
-                    # 统计信息
-                    total_records = len(history_data)
-                    active_bans = len([r for r in history_data if not r.get("actual_unban_time")])
-
-                    html += f"""
-                    <div class="stats">
-                        <div class="stat-card">
-                            <div class="stat-number">{total_records}</div>
-                            <div class="stat-label">总封禁记录</div>
-                        </div>
-                        <div class="stat-card">
-                            <div class="stat-number">{active_bans}</div>
-                            <div class="stat-label">当前禁言中</div>
-                        </div>
-                    </div>
-                    """
-
-                    html += """
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>用户ID</th>
-                                <th>用户名</th>
-                                <th>禁言时间</th>
-                                <th>解禁时间</th>
-                                <th>禁言时长</th>
-                                <th>状态</th>
-                                <th>原因</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                    """
-
-                    for record in history_data[-100:][::-1]:  # 显示最近100条
-                        user_uid = record.get("user_uid", "")
-                        user_name = record.get("user_name", "")
-                        ban_time = record.get("ban_time", "")[:19]
-                        unban_time = record.get("unban_time", "")[:19]
-                        actual_unban_time = record.get("actual_unban_time", "")
-                        if actual_unban_time:
-                            actual_unban_time = actual_unban_time[:19]
-                        ban_hours = record.get("ban_hours", 2)
-                        reason = record.get("reason", "关键词刷屏")
-
-                        status = "已解禁" if record.get("actual_unban_time") else "禁言中"
-                        status_class = "status-unbanned" if status == "已解禁" else "status-banned"
-                        display_unban_time = actual_unban_time if actual_unban_time else unban_time
-
-                        html += f"""
-                            <tr>
-                                <td>{user_uid}</td>
-                                <td>{user_name}</td>
-                                <td>{ban_time}</td>
-                                <td>{display_unban_time}</td>
-                                <td>{ban_hours}小时</td>
-                                <td><span class="{status_class}">{status}</span></td>
-                                <td>{reason}</td>
-                            </tr>
-                        """
-
-                    html += """
-                        </tbody>
-                    </table>
-                    """
+                history_data = self._snapshot_history()
+                data_hash = self._data_hash(history_data)
+                cached = self._page_cache.get('history')
+                if cached is not None and cached[0] == data_hash:
+                    html = cached[1]
                 else:
-                    html = """
-                    <div class="empty-state">
-                        <div class="icon">📝</div>
-                        <h3>暂无封禁记录</h3>
-                        <p>还没有封禁记录</p>
-                    </div>
-                    """
-
-                return {
+                    html = render_history_html(history_data)
+                    self._page_cache['history'] = (data_hash, html)
+                resp = jsonify({
                     "html": html,
                     "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    "data_hash": str(hash(str(history_data)))
-                }
+                    "data_hash": data_hash
+                })
+                resp.set_etag(data_hash)
+                resp.headers['Cache-Control'] = 'no-cache, must-revalidate'
+                return resp.make_conditional(request)
 
             except Exception as e:
                 return {
@@ -641,109 +1014,36 @@ class SimpleWebConfig:
         @self.app.route('/api/ranking')
         def api_ranking():
             try:
-                history_data = []
-                if os.path.exists("ban_history.json"):
-                    with open("ban_history.json", 'r', encoding='utf-8') as f:
-                        history_data = json.load(f)
-
-                html = ""
-
-                if history_data:
-                    ban_count = defaultdict(int)
-                    total_ban_hours = defaultdict(int)
-                    last_ban_time = {}
-
-                    for record in history_data:
-                        user_uid = record["user_uid"]
-                        user_name = record["user_name"]
-                        ban_hours = record["ban_hours"]
-
-                        ban_count[user_uid] += 1
-                        total_ban_hours[user_uid] += ban_hours
-                        last_ban_time[user_uid] = record["ban_time"]
-
-                    ranking = []
-                    for user_uid, count in ban_count.items():
-                        ranking.append({
-                            "user_uid": user_uid,
-                            "user_name": next((r["user_name"] for r in history_data if r["user_uid"] == user_uid), "未知用户"),
-                            "ban_count": count,
-                            "total_hours": total_ban_hours[user_uid],
-                            "last_ban_time": last_ban_time[user_uid][:19]
-                        })
-
-                    ranking.sort(key=lambda x: x["ban_count"], reverse=True)
-
-                    # 统计信息
-                    total_users = len(ranking)
-                    total_bans = sum(user["ban_count"] for user in ranking)
-
-                    html += f"""
-                    <div class="stats">
-                        <div class="stat-card">
-                            <div class="stat-number">{total_users}</div>
-                            <div class="stat-label">被封禁用户数</div>
-                        </div>
-                        <div class="stat-card">
-                            <div class="stat-number">{total_bans}</div>
-                            <div class="stat-label">总封禁次数</div>
-                        </div>
-                    </div>
-                    """
-
-                    html += """
-                    <table class="ranking-table">
-                        <thead>
-                            <tr>
-                                <th>排名</th>
-                                <th>用户ID</th>
-                                <th>用户名</th>
-                                <th>封禁次数</th>
-                                <th>总禁言时长(小时)</th>
-                                <th>最后封禁时间</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                    """
-
-                    for i, user in enumerate(ranking[:20], 1):
-                        rank_class = ""
-                        if i == 1:
-                            rank_class = "rank-1"
-                        elif i == 2:
-                            rank_class = "rank-2"
-                        elif i == 3:
-                            rank_class = "rank-3"
-
-                        html += f"""
-                            <tr class="{rank_class}">
-                                <td><strong>{i}</strong></td>
-                                <td>{user['user_uid']}</td>
-                                <td>{user['user_name']}</td>
-                                <td>{user['ban_count']}</td>
-                                <td>{user['total_hours']}</td>
-                                <td>{user['last_ban_time']}</td>
-                            </tr>
-                        """
-
-                    html += """
-                        </tbody>
-                    </table>
-                    """
+                manager = self.manager
+                if manager is not None:
+                    # 排行数据走增量维护的聚合，不再全量扫历史快照
+                    data_hash = manager.get_data_hash()
+                    cached = self._page_cache.get('ranking')
+                    if cached is not None and cached[0] == data_hash:
+                        html = cached[1]
+                    else:
+                        rows, total_users, total_bans = manager.get_ban_ranking()
+                        html = RANKING_TEMPLATE.render(
+                            rows=rows, total_users=total_users, total_bans=total_bans)
+                        self._page_cache['ranking'] = (data_hash, html)
                 else:
-                    html = """
-                    <div class="empty-state">
-                        <div class="icon">🏆</div>
-                        <h3>暂无排行榜数据</h3>
-                        <p>还没有封禁记录</p>
-                    </div>
-                    """
-
-                return {
+                    # 机器人尚未连上时退回文件快照全量聚合
+                    history_data = self._snapshot_history()
+                    data_hash = self._data_hash(history_data)
+                    cached = self._page_cache.get('ranking')
+                    if cached is not None and cached[0] == data_hash:
+                        html = cached[1]
+                    else:
+                        html = render_ranking_html(history_data)
+                        self._page_cache['ranking'] = (data_hash, html)
+                resp = jsonify({
                     "html": html,
                     "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    "data_hash": str(hash(str(history_data)))
-                }
+                    "data_hash": data_hash
+                })
+                resp.set_etag(data_hash)
+                resp.headers['Cache-Control'] = 'no-cache, must-revalidate'
+                return resp.make_conditional(request)
 
             except Exception as e:
                 return {
@@ -752,131 +1052,146 @@ class SimpleWebConfig:
                     "data_hash": "error"
                 }
 
-        # API 路由 - 检查更新
-        @self.app.route('/api/check_update')
-        def api_check_update():
-            page = request.args.get('page', 'banned')
-            current_hash = request.args.get('hash', '')
-
-            try:
-                if page == 'banned':
-                    banned_data = {}
-                    if os.path.exists("banned_users.pkl"):
-                        with open("banned_users.pkl", 'rb') as f:
-                            banned_data = pickle.load(f)
-                    new_hash = str(hash(str(banned_data)))
-
-                elif page == 'history':
-                    history_data = []
-                    if os.path.exists("ban_history.json"):
-                        with open("ban_history.json", 'r', encoding='utf-8') as f:
-                            history_data = json.load(f)
-                    new_hash = str(hash(str(history_data)))
-
-                elif page == 'ranking':
-                    history_data = []
-                    if os.path.exists("ban_history.json"):
-                        with open("ban_history.json", 'r', encoding='utf-8') as f:
-                            history_data = json.load(f)
-                    new_hash = str(hash(str(history_data)))
-
-                return {
-                    "updated": new_hash != current_hash,
-                    "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-
-            except Exception as e:
-                return {
-                    "updated": False,
-                    "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-
     def run(self):
-        print(f"直播间管理: http://localhost:{self.port}")
+        app_logger.info("直播间管理: http://localhost:%s", self.port)
         import logging
         log = logging.getLogger('werkzeug')
         log.setLevel(logging.ERROR)
-        self.app.run(host='0.0.0.0', port=self.port, debug=False, use_reloader=False)
+        try:
+            from waitress import serve
+        except ImportError:
+            # 未安装 waitress 时退回 Flask 自带的开发服务器
+            self.app.run(host='0.0.0.0', port=self.port, debug=False,
+                         use_reloader=False, threaded=True)
+        else:
+            serve(self.app, host='0.0.0.0', port=self.port,
+                  threads=8, connection_limit=100, channel_timeout=10)
 
     def start_in_background(self):
         thread = threading.Thread(target=self.run, daemon=True)
         thread.start()
         return thread
 
-class ConsoleToLogHandler:
-    def __init__(self, logger, log_level=logging.INFO):
-        self.logger = logger
-        self.log_level = log_level
-        self.original_stdout = sys.stdout
-        self.original_stderr = sys.stderr
-
-    def write(self, message):
-        if message.strip():
-            self.logger.log(self.log_level, message.strip())
-
-    def flush(self):
-        pass
-
 def setup_universal_logging(log_dir="logs"):
     os.makedirs(log_dir, exist_ok=True)
     logger = logging.getLogger("B站直播监控")
     logger.setLevel(logging.INFO)
     file_handler = logging.FileHandler(
         f"{log_dir}/{datetime.now().strftime('%Y-%m-%d')}.log",
-        encoding='utf-8'
+        encoding='utf-8',
+        delay=True
     )
     file_handler.setFormatter(
         logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     )
-    logger.addHandler(file_handler)
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter('%(message)s'))
-    logger.addHandler(console_handler)
-    sys.stdout = ConsoleToLogHandler(logger, logging.INFO)
-    sys.stderr = ConsoleToLogHandler(logger, logging.ERROR)
+    # 磁盘和终端写入都挪到后台线程，事件循环里记日志只是一次入队
+    log_q = SimpleQueue()
+    listener = logging.handlers.QueueListener(log_q, file_handler, console_handler)
+    listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_q))
     return logger
 
 class SpamDetector:
-    def __init__(self, config):
-        self.config = config
-        self.time_window = config.get("刷屏检测时间窗口", 10)
-        self.max_messages = config.get("刷屏检测最大消息数", 5)
-        self.user_messages = defaultdict(deque)
+    def __init__(self, config: dict):
+        self.user_messages: dict = {}
         self.spam_warnings = defaultdict(int)
-        self.keyword_messages = defaultdict(deque)
+        self.keyword_messages: dict = {}
         self.keyword_warnings = defaultdict(int)
+        self.max_tracked_users: int = 10000
+        self._expiry_heap: list = []
+        self.reload(config)
+
+    def reload(self, config: dict) -> None:
+        """配置变更后刷新缓存的检测参数，关键词匹配器一并重建。"""
+        self.config = config
+        self.time_window: float = float(config.get("刷屏检测时间窗口", 10))
+        self.max_messages: int = int(config.get("刷屏检测最大消息数", 5))
+        self.max_keyword_messages: int = int(config.get("关键词最大消息数", 3)) - 1
         self.keyword_patterns = self._compile_keyword_patterns()
 
     def _compile_keyword_patterns(self):
         keywords = self.config.get("关键词列表", ["喝", "思考", "惊讶", "疑惑"])
-        patterns = []
+        # 纯文本关键词走 C 层子串查找即可，只有真正的正则才进正则引擎
+        self.literal_keywords = tuple(sys.intern(kw) for kw in keywords if re.escape(kw) == kw)
+        self._min_kw_len = min((len(kw) for kw in self.literal_keywords), default=1)
+        self._ac_automaton = None
+        if self.literal_keywords:
+            try:
+                import ahocorasick
+            except ImportError:
+                pass  # 未安装 pyahocorasick 时退回逐词子串查找
+            else:
+                automaton = ahocorasick.Automaton()
+                for kw in self.literal_keywords:
+                    automaton.add_word(kw, kw)
+                automaton.make_automaton()
+                self._ac_automaton = automaton
+        parts = []
         for keyword in keywords:
+            if keyword in self.literal_keywords:
+                continue
             try:
-                pattern = re.compile(keyword)
-                patterns.append(pattern)
+                re.compile(keyword)
+                parts.append(f"(?:{keyword})")
             except re.error:
-                pattern = re.compile(re.escape(keyword))
-                patterns.append(pattern)
-        return patterns
-
-    def check_keyword_spam(self, user_id: str, message: str) -> bool:
-        matched = False
-        for pattern in self.keyword_patterns:
-            if pattern.search(message):
-                matched = True
-                break
-
-        if not matched:
+                parts.append(f"(?:{re.escape(keyword)})")
+        if self.literal_keywords and self._ac_automaton is None and len(self.literal_keywords) > 8:
+            # 没有自动机且关键词一多时，单个交替正则比逐词 in 扫描更划算
+            parts.extend(re.escape(kw) for kw in sorted(self.literal_keywords, key=len, reverse=True))
+            self.literal_keywords = ()
+        if not parts:
+            return None
+        return re.compile("|".join(parts))
+
+    def _matches_keyword(self, message: str) -> bool:
+        keyword_patterns = self.keyword_patterns
+        # 比最短关键词还短的消息不可能命中；仅当没有正则关键词时才能这样断言
+        if keyword_patterns is None and len(message) < self._min_kw_len:
+            return False
+        automaton = self._ac_automaton
+        if automaton is not None:
+            # 自动机单趟扫完所有纯文本关键词，耗时与关键词数量无关
+            if next(automaton.iter(message), None) is not None:
+                return True
+        else:
+            for keyword in self.literal_keywords:
+                if keyword in message:
+                    return True
+        return keyword_patterns is not None and keyword_patterns.search(message) is not None
+
+    def check_keyword_spam(self, user_id: str, message: str, now: float = None) -> bool:
+        if not self._matches_keyword(message):
             return False
 
-        current_time = time.time()
-        user_queue = self.keyword_messages[user_id]
-        while user_queue and current_time - user_queue[0] > self.time_window:
-            user_queue.popleft()
+        # 热路径上把 self 属性钉到局部变量，LOAD_FAST 替掉逐次的属性查找
+        keyword_messages = self.keyword_messages
+        max_keyword_messages = self.max_keyword_messages
+        time_window = self.time_window
+
+        # 单调时钟不受系统对时影响，窗口判断不会因时钟回拨误判
+        # 调用方可把同一事件的时间戳传进来，省掉每条消息重复取时钟
+        current_time = time.monotonic() if now is None else now
+        user_queue = keyword_messages.get(user_id)
+        if user_queue is None:
+            if len(keyword_messages) >= self.max_tracked_users:
+                # 两次清理之间被海量新 UID 刷到容量上限时，先淘汰最早跟踪的用户
+                oldest_uid = next(iter(keyword_messages))
+                del keyword_messages[oldest_uid]
+                self.keyword_warnings.pop(oldest_uid, None)
+            user_queue = keyword_messages[user_id] = deque(maxlen=max_keyword_messages + 1)
+            heapq.heappush(self._expiry_heap, (current_time, user_id))
+        else:
+            # 顺手清掉该用户已出窗的旧时间戳，摊还到每条消息上
+            cutoff = current_time - time_window
+            popleft = user_queue.popleft
+            while user_queue and user_queue[0] < cutoff:
+                popleft()
         user_queue.append(current_time)
 
-        max_keyword_messages = (self.config.get("关键词最大消息数", 3) - 1)
-        if len(user_queue) > max_keyword_messages:
+        # 环形队列装满且最早一条仍在窗口内，即为刷屏
+        if len(user_queue) > max_keyword_messages and current_time - user_queue[0] <= time_window:
             self.keyword_warnings[user_id] += 1
             return True
         return False
@@ -884,40 +1199,58 @@ class SpamDetector:
     def get_warning_count(self, user_id: str) -> int:
         return self.keyword_warnings.get(user_id, 0)
 
-    def clear_old_entries(self):
-        current_time = time.time()
-
-        for user_id, timestamps in self.keyword_messages.items():
-            while timestamps and current_time - timestamps[0] > self.time_window:
-                timestamps.popleft()
+    def clear_old_entries(self) -> None:
+        # 只检查到期堆里可能过期的用户，不再全量扫一遍所有人
+        current_time = time.monotonic()
+        cutoff = current_time - self.time_window
+        heap = self._expiry_heap
+
+        while heap and heap[0][0] <= cutoff:
+            _, user_id = heapq.heappop(heap)
+            timestamps = self.keyword_messages.get(user_id)
+            if timestamps is None:
+                continue
+            popleft = timestamps.popleft
+            while timestamps and timestamps[0] <= cutoff:
+                popleft()
+            if timestamps:
+                # 仍有窗口内的记录，按新的最早时间戳重新入堆
+                heapq.heappush(heap, (timestamps[0], user_id))
+            else:
+                del self.keyword_messages[user_id]
+                self.keyword_warnings.pop(user_id, None)
 
 class AnnouncementManager:
     def __init__(self, room, config):
         self.room = room
         self.config = config
-        self.last_announcement_time = 0
         self.announcement_interval = config.get("公告发送间隔", 900)
+        self._regular_content = config.get("公告内容", "直播间刷屏自动禁言，2小时自动解除")
+        self._regular_danmaku = Danmaku(self._regular_content)
 
     async def send_ban_announcement(self, user_name, ban_hours):
         announcement = f"用户 {user_name} 因刷屏已被禁言 {ban_hours} 小时，请遵守直播间规则"
         try:
             danmaku_obj = Danmaku(announcement)
             await self.room.send_danmaku(danmaku_obj)
-            print(f"[公告] 已发送封禁提醒: {announcement}")
+            app_logger.info("[公告] 已发送封禁提醒: %s", announcement)
         except Exception as e:
-            print(f"[公告错误] 发送封禁提醒失败: {e}")
+            app_logger.error("[公告错误] 发送封禁提醒失败: %s", e)
+
+    async def send_regular_announcement_now(self):
+        """调度器已保证节奏，这里直接发送，不再自查间隔。"""
+        announcement_content = self.config.get("公告内容", "直播间刷屏自动禁言，2小时自动解除")
+        if announcement_content != self._regular_content:
+            # 公告内容是运行期常量，只有配置变了才重建弹幕对象
+            self._regular_content = announcement_content
+            self._regular_danmaku = Danmaku(announcement_content)
+        try:
+            await self.room.send_danmaku(self._regular_danmaku)
+            app_logger.info("[定时公告] 已发送: %s", announcement_content)
+        except Exception as e:
+            app_logger.error("[定时公告错误] 发送失败: %s", e)
 
-    async def send_regular_announcement(self):
-        current_time = time.time()
-        if current_time - self.last_announcement_time >= self.announcement_interval:
-            announcement_content = self.config.get("公告内容", "直播间刷屏自动禁言，2小时自动解除")
-            try:
-                danmaku_obj = Danmaku(announcement_content)
-                await self.room.send_danmaku(danmaku_obj)
-                self.last_announcement_time = current_time
-                print(f"[定时公告] 已发送: {announcement_content}")
-            except Exception as e:
-                print(f"[定时公告错误] 发送失败: {e}")
+_config_cache = {}
 
 def load_config() -> dict:
     config_path = Path("config.yml")
@@ -940,24 +1273,55 @@ def load_config() -> dict:
             "关键词列表": ["喝", "思考", "惊讶", "疑惑"]
         }
         with open(config_path, 'w', encoding='utf-8') as f:
-            yaml.dump(default_config, f, allow_unicode=True, default_flow_style=False)
-
-    with open(config_path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+            yaml.dump(default_config, f,
+                      Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+                      allow_unicode=True, default_flow_style=False)
+        # 默认配置就在手上，不必再把刚写的文件读回来解析一遍
+        _config_cache["mtime"] = config_path.stat().st_mtime_ns
+        _config_cache["config"] = default_config
+        return default_config
+
+    mtime = config_path.stat().st_mtime_ns
+    if _config_cache.get("mtime") == mtime:
+        return _config_cache["config"]
+
+    with open(config_path, 'rb') as f:
+        config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    _config_cache["mtime"] = mtime
+    _config_cache["config"] = config
+    return config
 
 async def main():
-    global config, restart_requested, danmaku_room
+    global config, restart_requested, main_loop, http_session
 
+    main_loop = asyncio.get_running_loop()
+    if http_session is None:
+        # 全程共用一个带连接池的 HTTP 会话，禁言/解禁请求免去每次 DNS+TLS 握手
+        try:
+            import aiohttp
+            from bilibili_api import set_session
+            http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300)
+            )
+            set_session(http_session)
+        except ImportError:
+            pass  # 库版本不支持注入会话时沿用默认行为
     web_ui = SimpleWebConfig("config.yml", port=5000)
     web_ui.start_in_background()
 
+    restart_event = asyncio.Event()
+    # Flask 线程通过它通知事件循环立即重启，而不是等 connect() 返回后才发现
+    web_ui.request_restart = lambda: main_loop.call_soon_threadsafe(restart_event.set)
+
+    backoff = 5.0
     while True:
+        attempt_start = time.monotonic()
         try:
             if restart_requested:
-                print("检测到重启请求，准备重启...")
+                app_logger.info("检测到重启请求，准备重启...")
                 restart_requested = False
                 await asyncio.sleep(5)
-                break
+                continue
 
             config = load_config()
             cookies = {
@@ -984,73 +1348,189 @@ async def main():
                 credential=cred
             )
             room = live.LiveRoom(room_display_id=room_id, credential=cred)
-            danmaku_room = room
 
             unban_manager = PersistentUnbanManager(room, config)
             announcement_manager = AnnouncementManager(room, config)
+            web_ui.manager = unban_manager
 
             await unban_manager.sync_banned_status()
 
+            ban_queue = asyncio.Queue(maxsize=256)
+
+            ban_hours = config.get("禁言时长", 2)
+
             async def handle_spam(user_uid, user_name):
                 warning_count = spam_detector.get_warning_count(user_uid)
+                await unban_manager.ban_user_with_auto_unban(user_uid, user_name)
+                await announcement_manager.send_ban_announcement(user_name, ban_hours)
+                app_logger.info("[刷屏处理] 已处理刷屏用户: %s，警告次数: %s", user_name, warning_count)
 
-                if warning_count >= 2:
-                    result = await unban_manager.ban_user_with_auto_unban(user_uid, user_name)
-                    ban_hours = config.get("禁言时长", 2)
-                    await announcement_manager.send_ban_announcement(user_name, ban_hours)
-                    print(f"[刷屏处理] 已处理刷屏用户: {user_name}，警告次数: {warning_count}")
+            async def ban_worker():
+                while True:
+                    batch = [await ban_queue.get()]
+                    while len(batch) < 16:
+                        try:
+                            batch.append(ban_queue.get_nowait())
+                        except asyncio.QueueEmpty:
+                            break
+
+                    # B 站没有批量禁言接口，同批内并发请求复用同一连接
+                    results = await asyncio.gather(
+                        *(handle_spam(uid, name) for uid, name in batch),
+                        return_exceptions=True
+                    )
+                    for (user_uid, user_name), result in zip(batch, results):
+                        if isinstance(result, Exception):
+                            app_logger.error("[禁言错误] 处理用户 %s 失败: %s", user_name, result)
+                        ban_queue.task_done()
+
+            check_keyword_spam = spam_detector.check_keyword_spam
+            get_warning_count = spam_detector.get_warning_count
 
             @danmaku.on('DANMU_MSG')
             async def on_danmaku(event):
-                user_uid = event["data"]["info"][2][0]
-                user_name = event["data"]["info"][0][15]["user"]["base"]["name"]
-                user_danmaku = event["data"]["info"][1]
-
-                if spam_detector.check_keyword_spam(user_uid, user_danmaku):
-                    await handle_spam(user_uid, user_name)
-
-                print(f"[弹幕] {user_name} (UID: {user_uid})：{user_danmaku}")
+                try:
+                    info = event["data"]["info"]
+                    user_uid = info[2][0]
+                    user_name = info[0][15]["user"]["base"]["name"]
+                    user_danmaku = info[1]
+                except (KeyError, IndexError, TypeError):
+                    return  # 结构对不上的消息直接忽略，不把异常抛进连接循环
+
+                if check_keyword_spam(user_uid, user_danmaku, time.monotonic()):
+                    if get_warning_count(user_uid) >= 2:
+                        try:
+                            ban_queue.put_nowait((user_uid, user_name))
+                        except asyncio.QueueFull:
+                            pass
+
+                if chat_logger.isEnabledFor(logging.INFO):
+                    chat_logger.info("[弹幕] %s (UID: %s)：%s", user_name, user_uid, user_danmaku)
 
                 danmaku_data = {
-                    'time': datetime.now().strftime('%H:%M:%S'),
+                    'time': _now_hms(),
                     'user': user_name,
                     'message': user_danmaku
                 }
 
-                if danmaku_messages.full():
-                    danmaku_messages.get()
-                danmaku_messages.put(danmaku_data)
+                try:
+                    danmaku_messages.put_nowait(danmaku_data)
+                except asyncio.QueueFull:
+                    pass
 
-            async def cleanup_spam_records():
+            async def consume_danmaku():
                 while True:
-                    await asyncio.sleep(60)
-                    spam_detector.clear_old_entries()
-
-            async def auto_unban_check():
-                while True:
-                    await asyncio.sleep(300)
-                    await unban_manager.check_and_unban()
-
-            async def regular_announcement():
+                    batch = [await danmaku_messages.get()]
+                    while len(batch) < 64:
+                        try:
+                            batch.append(danmaku_messages.get_nowait())
+                        except asyncio.QueueEmpty:
+                            break
+                    recent_danmaku.extend(batch)
+
+            loop = asyncio.get_running_loop()
+
+            async def run_housekeeping(jobs):
+                # 所有周期作业共用一个任务和一个最小堆，按各自间隔依次触发；
+                # 间隔可以是可调用对象，用于按实际到期时间动态定时；
+                # 作业可以带第三个元素指定首次触发延迟
+                def next_interval(interval):
+                    return interval() if callable(interval) else interval
+
+                now = loop.time()
+                heap = [
+                    (now + (job[2] if len(job) > 2 else next_interval(job[1])),
+                     index, job[1], job[0])
+                    for index, job in enumerate(jobs)
+                ]
+                heapq.heapify(heap)
                 while True:
-                    await asyncio.sleep(60)
-                    await announcement_manager.send_regular_announcement()
-
-            cleanup_task = asyncio.create_task(cleanup_spam_records())
-            unban_task = asyncio.create_task(auto_unban_check())
-            announcement_task = asyncio.create_task(regular_announcement())
+                    fire_at, index, interval, fn = heap[0]
+                    delay = fire_at - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    heapq.heappop(heap)
+                    try:
+                        result = fn()
+                        if asyncio.iscoroutine(result):
+                            await result
+                    except Exception as e:
+                        app_logger.error("[定时任务错误] %s", e)
+                    heapq.heappush(heap, (loop.time() + next_interval(interval), index, interval, fn))
+
+            def unban_wait():
+                # 直接睡到最近的解禁到期点；空表或远期时以 60 秒兜底
+                deadline = unban_manager.next_unban_deadline()
+                if deadline is None:
+                    return 60.0
+                return min(60.0, max(0.5, deadline - time.time()))
+
+            ban_task = asyncio.create_task(ban_worker())
+            consume_task = asyncio.create_task(consume_danmaku())
+            housekeeping_task = asyncio.create_task(run_housekeeping([
+                (spam_detector.clear_old_entries, 300),
+                (unban_manager.check_and_unban, unban_wait),
+                # 首条公告启动约一分钟后就发，不必等满整个发送间隔
+                (announcement_manager.send_regular_announcement_now,
+                 announcement_manager.announcement_interval, 60.0),
+            ]))
 
-            while not restart_requested:
-                await danmaku.connect()
-                await asyncio.sleep(1)
+            try:
+                retry_delay = 1
+                while not restart_requested and not restart_event.is_set():
+                    connect_started = loop.time()
+                    connect_task = asyncio.create_task(danmaku.connect())
+                    restart_wait = asyncio.create_task(restart_event.wait())
+                    done, pending = await asyncio.wait(
+                        {connect_task, restart_wait},
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in pending:
+                        task.cancel()
+                    if connect_task in done:
+                        try:
+                            connect_task.result()
+                        except Exception as e:
+                            # 把连接异常就地消化掉，交给下面的退避逻辑重连
+                            app_logger.warning("[连接] 弹幕连接断开: %s", e)
+                    if restart_event.is_set():
+                        restart_event.clear()
+                        restart_requested = True
+                        break
+                    if loop.time() - connect_started > 30:
+                        retry_delay = 1  # 连接存活够久，掉线后立即重连
+                    else:
+                        await asyncio.sleep(retry_delay)
+                        retry_delay = min(retry_delay * 2, 60)
+            finally:
+                # 无论软重启还是异常退出本轮，都先收尾后台任务和写线程，
+                # 避免旧实例的定时任务继续对着旧 room 发公告、调解禁接口
+                for task in (ban_task, consume_task, housekeeping_task):
+                    task.cancel()
+                await asyncio.gather(ban_task, consume_task, housekeeping_task,
+                                     return_exceptions=True)
+                unban_manager.close()
 
         except Exception as e:
-            print(f"主循环错误: {e}")
-            await asyncio.sleep(5)
+            app_logger.error("主循环错误: %s", e)
+            if time.monotonic() - attempt_start > 60:
+                backoff = 5.0  # 本轮跑了足够久，视为偶发故障，重置退避
+            await asyncio.sleep(backoff + random.uniform(0, 0.5 * backoff))
+            backoff = min(backoff * 2, 60.0)
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass  # 未安装 uvloop 时使用标准事件循环
     logger = setup_universal_logging()
-    while True:
-        asyncio.run(main())
-        print("程序重启中...")
-        time.sleep(2)
+    # 监督逻辑都在 main() 里，这里只负责跑一个常驻事件循环
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()